@@ -4,6 +4,7 @@ from flask import Flask, request, jsonify
 from .config             import Config
 from .extensions         import db, migrate, jwt, bcrypt, cors
 from .models             import User, LicenseType, Event, RSVP, Comment
+from .                   import jobs, bulk
 from flask_jwt_extended  import create_access_token, jwt_required, get_jwt_identity
 from datetime            import datetime
 
@@ -16,6 +17,8 @@ def create_app():
     migrate.init_app(app, db)
     jwt.init_app(app)
     bcrypt.init_app(app)
+    jobs.init_app(app)
+    bulk.init_app(app)
 
     @app.route('/auth/register', methods=['POST'])
     def register():
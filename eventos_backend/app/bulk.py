@@ -0,0 +1,287 @@
+"""
+Importación y exportación masiva de eventos (CSV y JSON Lines).
+
+La importación lee el archivo fila por fila (decodificando cada línea, así un
+byte que no es UTF-8 se reporta con su número de fila), valida cada una contra los códigos
+de licencia cargados una sola vez desde license_types y las inserta por lotes
+con un único INSERT por lote (executemany de Core; PyMySQL lo reescribe como
+INSERT ... VALUES (...), (...)). Cada lote se confirma por separado; si la base
+rechaza un lote se reintenta fila por fila, y los errores se reportan por número
+de fila sin detener el resto.
+
+La exportación recorre la tabla con un cursor del lado del servidor
+(stream_results) y escribe cada fila apenas llega.
+"""
+
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .dates      import parse_utc
+from .extensions import db
+from .models     import User, LicenseType, Event
+
+FORMATS = ("csv", "jsonl")
+
+EXPORT_COLUMNS = [
+    "id", "creator_id", "title", "description", "event_date",
+    "location", "license_code", "created_at", "updated_at",
+]
+
+
+def detect_format(nombre, formato=None):
+    if formato:
+        return formato
+    if nombre and nombre.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+class InvalidEncoding(Exception):
+    """Una línea del archivo no es UTF-8 válido."""
+    def __init__(self, linea):
+        super().__init__(f"La fila {linea} no está codificada en UTF-8.")
+        self.linea = linea
+
+
+def _lines(stream):
+    """Decodifica el archivo binario de a una línea para saber en qué fila está un byte inválido."""
+    for num, crudo in enumerate(stream, start=1):
+        try:
+            yield crudo.decode("utf-8-sig" if num == 1 else "utf-8")
+        except UnicodeDecodeError:
+            raise InvalidEncoding(num)
+
+
+def _rows(stream, formato):
+    """Genera (número de fila, dict) leyendo el archivo binario de a una línea."""
+    stream = _lines(stream)
+    if formato == "csv":
+        lector = csv.DictReader(stream)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+
+    for num, linea in enumerate(stream, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as ex:
+            yield num, ex
+            continue
+        yield num, fila
+
+
+# Campos de texto: (nombre, largo máximo en caracteres, obligatorio). Text de MySQL admite 65535 bytes.
+TEXT_FIELDS = [
+    ("title",        100,   True),
+    ("event_date",   32,    True),
+    ("license_code", 20,    True),
+    ("description",  None,  False),
+    ("location",     150,   False),
+]
+DESCRIPTION_MAX_BYTES = 65535
+
+
+def _validate(fila, licencias, creator_id):
+    """Devuelve (valores para INSERT, None) o (None, mensaje de error)."""
+    if isinstance(fila, Exception):
+        return None, f"JSON inválido: {fila}"
+    if not isinstance(fila, dict):
+        return None, "Cada fila debe ser un objeto"
+
+    valores = {}
+    for campo, largo, obligatorio in TEXT_FIELDS:
+        valor = fila.get(campo)
+        if valor is not None and not isinstance(valor, str):
+            return None, f"El campo '{campo}' debe ser texto."
+        valor = (valor or "").strip()
+        if largo and len(valor) > largo:
+            return None, f"El campo '{campo}' no puede superar {largo} caracteres."
+        valores[campo] = valor or None
+
+    if not (valores["title"] and valores["event_date"] and valores["license_code"]):
+        return None, "Los campos 'title', 'event_date' y 'license_code' son obligatorios."
+    if valores["description"] and len(valores["description"].encode("utf-8")) > DESCRIPTION_MAX_BYTES:
+        return None, f"El campo 'description' no puede superar {DESCRIPTION_MAX_BYTES} bytes."
+    if valores["license_code"] not in licencias:
+        return None, f"Código de licencia desconocido: '{valores['license_code']}'"
+    try:
+        # Con zona horaria (p. ej. +02:00) se convierte a UTC, como el resto de las fechas guardadas
+        fecha = parse_utc(valores["event_date"])
+    except ValueError:
+        return None, "Formato de fecha inválido. Use 'YYYY-MM-DDTHH:MM:SS'."
+
+    return {
+        "creator_id":   creator_id,
+        "title":        valores["title"],
+        "description":  valores["description"],
+        "event_date":   fecha,
+        "location":     valores["location"],
+        "license_code": valores["license_code"],
+    }, None
+
+
+def import_events(stream, formato, creator_id, batch_size=None):
+    """
+    Importa eventos desde un archivo abierto en modo binario. Devuelve
+    {"inserted": n, "errors": [{"row": num, "error": msg}, ...]}.
+
+    Si el INSERT de un lote falla, el lote se reintenta fila por fila y solo
+    las filas que la base rechaza quedan en errors. Si una fila no es UTF-8 se
+    guardan las anteriores, se reporta esa fila y el resto del archivo no se procesa;
+    los lotes ya confirmados quedan contados en inserted.
+    """
+    batch_size = batch_size or current_app.config["BULK_IMPORT_BATCH_SIZE"]
+    licencias = {code for code, in db.session.query(LicenseType.code)}
+    stmt = insert(Event.__table__)
+
+    insertados = 0
+    errores = []
+    lote = []   # [(número de fila, valores)]
+
+    def guardar():
+        nonlocal insertados
+        try:
+            db.session.execute(stmt, [valores for _, valores in lote])
+            db.session.commit()
+            insertados += len(lote)
+        except SQLAlchemyError:
+            db.session.rollback()
+            for num, valores in lote:
+                try:
+                    db.session.execute(stmt, valores)
+                    db.session.commit()
+                    insertados += 1
+                except SQLAlchemyError as ex:
+                    db.session.rollback()
+                    errores.append({"row": num, "error": f"Error de base de datos: {type(getattr(ex, 'orig', ex)).__name__}"})
+        lote.clear()
+
+    try:
+        for num, fila in _rows(stream, formato):
+            valores, error = _validate(fila, licencias, creator_id)
+            if error:
+                errores.append({"row": num, "error": error})
+                continue
+            lote.append((num, valores))
+            if len(lote) >= batch_size:
+                guardar()
+    except InvalidEncoding as ex:
+        errores.append({"row": ex.linea, "error": f"{ex} No se procesaron las filas siguientes."})
+    if lote:
+        guardar()
+
+    errores.sort(key=lambda e: e["row"])
+    return {"inserted": insertados, "errors": errores}
+
+
+def export_events(out, formato):
+    """Escribe todos los eventos en `out` leyendo con un cursor del lado del servidor."""
+    consulta = (
+        select(*(getattr(Event, col) for col in EXPORT_COLUMNS))
+        .order_by(Event.id)
+        .execution_options(stream_results=True, yield_per=1000)
+    )
+
+    escritor = None
+    if formato == "csv":
+        escritor = csv.writer(out)
+        escritor.writerow(EXPORT_COLUMNS)
+
+    total = 0
+    for fila in db.session.execute(consulta):
+        valores = [v.isoformat() if isinstance(v, datetime) else v for v in fila]
+        if escritor:
+            escritor.writerow(valores)
+        else:
+            out.write(json.dumps(dict(zip(EXPORT_COLUMNS, valores)), ensure_ascii=False) + "\n")
+        total += 1
+    return total
+
+
+# ---------------------------------------------------------------------------
+# CLI: flask events import / export
+# ---------------------------------------------------------------------------
+
+events_cli = AppGroup('events', help="Importación y exportación masiva de eventos.")
+
+
+def _open(ruta, modo):
+    # La lectura es binaria: import_events decodifica cada línea.
+    # newline='' para que el módulo csv maneje los saltos de línea dentro de campos entre comillas
+    if ruta == '-':
+        return sys.stdin.buffer if modo == 'r' else sys.stdout
+    if modo == 'r':
+        return open(ruta, 'rb')
+    return open(ruta, modo, encoding='utf-8', newline='')
+
+
+@events_cli.command('import')
+@click.argument('ruta', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--creator', required=True, help="Username del creador de los eventos.")
+@click.option('--format', 'formato', type=click.Choice(FORMATS), default=None, help="Por defecto según la extensión.")
+@click.option('--batch-size', type=int, default=None, help="Filas por INSERT/commit.")
+def import_command(ruta, creator, formato, batch_size):
+    """Importa eventos desde un archivo CSV o JSON Lines ('-' para stdin)."""
+    u = User.query.filter_by(username=creator).first()
+    if not u:
+        raise click.ClickException(f"Usuario '{creator}' no encontrado")
+
+    inicio = datetime.utcnow()
+    archivo = _open(ruta, 'r')
+    try:
+        resultado = import_events(archivo, detect_format(ruta, formato), u.id, batch_size)
+    finally:
+        if archivo is not sys.stdin.buffer:
+            archivo.close()
+    segundos = max((datetime.utcnow() - inicio).total_seconds(), 1e-6)
+
+    for e in resultado["errors"]:
+        click.echo(f"Fila {e['row']}: {e['error']}", err=True)
+    click.echo(
+        f"{resultado['inserted']} eventos importados, {len(resultado['errors'])} filas con error "
+        f"({resultado['inserted'] / segundos:.0f} filas/s)"
+    )
+
+
+@events_cli.command('export')
+@click.argument('ruta', type=click.Path(dir_okay=False, allow_dash=True), default='-')
+@click.option('--format', 'formato', type=click.Choice(FORMATS), default=None, help="Por defecto según la extensión.")
+def export_command(ruta, formato):
+    """Exporta todos los eventos a CSV o JSON Lines ('-' para stdout)."""
+    archivo = _open(ruta, 'w')
+    try:
+        total = export_events(archivo, detect_format(ruta, formato))
+    finally:
+        if archivo is not sys.stdout:
+            archivo.close()
+    click.echo(f"{total} eventos exportados", err=True)
+
+
+def upload_stream(req):
+    """
+    Devuelve (stream binario, formato) para una subida: multipart con el campo 'file'
+    o el archivo directamente en el cuerpo (text/csv o application/x-ndjson).
+    """
+    archivo = req.files.get('file')
+    if archivo:
+        crudo  = archivo.stream
+        nombre = archivo.filename
+    else:
+        crudo  = io.BufferedReader(req.stream)
+        nombre = "upload.jsonl" if req.mimetype in ("application/x-ndjson", "application/jsonl") else "upload.csv"
+    return crudo, detect_format(nombre, req.args.get('format'))
+
+
+def init_app(app):
+    app.cli.add_command(events_cli)
@@ -8,3 +8,14 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY             = os.getenv("JWT_SECRET_KEY")
     CORS_HEADERS               = 'Content-Type'
+
+    # Cola de trabajos en segundo plano (flask worker)
+    JOBS_WORKER_CONCURRENCY    = int(os.getenv("JOBS_WORKER_CONCURRENCY", 2))
+    JOBS_WORKER_MODE           = os.getenv("JOBS_WORKER_MODE", "thread")
+    JOBS_POLL_INTERVAL         = float(os.getenv("JOBS_POLL_INTERVAL", 1))
+    JOBS_MAX_ATTEMPTS          = int(os.getenv("JOBS_MAX_ATTEMPTS", 5))
+    JOBS_BACKOFF_BASE          = float(os.getenv("JOBS_BACKOFF_BASE", 5))
+    JOBS_LEASE_SECONDS         = int(os.getenv("JOBS_LEASE_SECONDS", 600))
+
+    # Importación masiva de eventos (flask events import / POST /events/import)
+    BULK_IMPORT_BATCH_SIZE     = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 500))
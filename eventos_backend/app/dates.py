@@ -0,0 +1,9 @@
+from datetime import datetime, timezone
+
+
+def parse_utc(valor):
+    """Fecha ISO; si trae zona horaria se pasa a UTC sin tzinfo, como se guarda en la base."""
+    fecha = datetime.fromisoformat(valor)
+    if fecha.tzinfo:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
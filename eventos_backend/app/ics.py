@@ -0,0 +1,174 @@
+"""
+Generación y caché del feed iCalendar (.ics) de cada usuario.
+
+El feed se arma con una sola consulta (users ⟕ rsvps ⟕ events) y se guarda
+en memoria por token junto con users.calendar_version. Cada RSVP, cancelación
+o edición de un evento incrementa esa versión en la misma transacción, así que
+todos los procesos detectan el cambio en su siguiente lectura. El ETag es
+"<user_id>-<versión>".
+"""
+
+from threading import Lock
+
+from sqlalchemy import and_
+
+from .extensions import db
+from .models     import User, Event, RSVP
+
+PRODID = "-//Eventos Express//Calendario//ES"
+
+_lock           = Lock()
+_feeds          = {}   # token -> {"user_id", "version", "body", "etag"}
+
+
+def _escape(valor):
+    return (
+        (valor or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(linea):
+    """Corta las líneas a 75 octetos como pide RFC 5545 (las continuaciones empiezan con espacio)."""
+    datos = linea.encode("utf-8")
+    if len(datos) <= 75:
+        return linea
+
+    partes = []
+    actual = ""
+    limite = 75
+    for ch in linea:
+        if len((actual + ch).encode("utf-8")) > limite:
+            partes.append(actual)
+            actual = ""
+            limite = 74
+        actual += ch
+    partes.append(actual)
+    return "\r\n ".join(partes)
+
+
+def _fecha(valor):
+    # Las fechas se guardan en UTC sin zona horaria (datetime.utcnow)
+    return valor.strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_calendar(eventos):
+    lineas = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:Eventos Express",
+    ]
+    for e in eventos:
+        lineas += [
+            "BEGIN:VEVENT",
+            f"UID:event-{e.id}@eventos-express",
+            # Sin utcnow(): el mismo ETag siempre debe corresponder al mismo cuerpo
+            f"DTSTAMP:{_fecha(e.updated_at or e.created_at or e.event_date)}",
+            f"DTSTART:{_fecha(e.event_date)}",
+            f"SUMMARY:{_escape(e.title)}",
+        ]
+        if e.description:
+            lineas.append(f"DESCRIPTION:{_escape(e.description)}")
+        if e.location:
+            lineas.append(f"LOCATION:{_escape(e.location)}")
+        lineas.append("END:VEVENT")
+    lineas.append("END:VCALENDAR")
+    return "\r\n".join(_fold(l) for l in lineas) + "\r\n"
+
+
+def get_feed(token):
+    """
+    Devuelve la entrada del feed para el token ({"user_id", "version", "body", "etag"}),
+    o None si el token no pertenece a ningún usuario.
+
+    Siempre se lee users.calendar_version (búsqueda por índice único); la caché solo
+    se usa si guarda esa misma versión, así que nunca sirve un feed viejo aunque la
+    escritura haya ocurrido en otro proceso.
+    """
+    actual = (
+        db.session.query(User.id, User.calendar_version)
+            .filter(User.calendar_token == token)
+            .first()
+    )
+    if not actual:
+        return None
+
+    with _lock:
+        entrada = _feeds.get(token)
+    if entrada and entrada["version"] == actual.calendar_version:
+        return entrada
+
+    # La versión se lee en la misma consulta que los eventos: cuerpo y versión son coherentes
+    filas = (
+        db.session.query(
+            User.id.label("user_id"),
+            User.calendar_version,
+            Event.id,
+            Event.title,
+            Event.description,
+            Event.event_date,
+            Event.location,
+            Event.created_at,
+            Event.updated_at
+        )
+        .outerjoin(RSVP, and_(RSVP.user_id == User.id, RSVP.status == 'accepted'))
+        .outerjoin(Event, Event.id == RSVP.event_id)
+        .filter(User.calendar_token == token)
+        .order_by(Event.event_date.asc())
+        .all()
+    )
+    if not filas:
+        return None
+
+    eventos = [f for f in filas if f.id is not None]
+    entrada = {
+        "user_id": filas[0].user_id,
+        "version": filas[0].calendar_version,
+        "body":    render_calendar(eventos),
+        "etag":    f"{filas[0].user_id}-{filas[0].calendar_version}",
+    }
+    with _lock:
+        previa = _feeds.get(token)
+        if not previa or previa["version"] <= entrada["version"]:
+            _feeds[token] = entrada
+    return entrada
+
+
+def forget(token):
+    """Descarta la entrada de un token que ya no se usa (p. ej. al rotarlo)."""
+    with _lock:
+        _feeds.pop(token, None)
+
+
+def bump(*user_ids):
+    """
+    Incrementa users.calendar_version de los usuarios indicados.
+    Debe llamarse antes del commit de la escritura que cambia su calendario.
+    """
+    if not user_ids:
+        return
+    (
+        User.query
+            .filter(User.id.in_([int(u) for u in user_ids]))
+            .update({User.calendar_version: User.calendar_version + 1}, synchronize_session=False)
+    )
+
+
+def bump_event(event_id):
+    """Incrementa la versión del calendario de todos los que confirmaron asistencia al evento."""
+    asistentes = (
+        db.session.query(RSVP.user_id)
+            .filter(RSVP.event_id == event_id, RSVP.status == 'accepted')
+    )
+    (
+        User.query
+            .filter(User.id.in_(asistentes.scalar_subquery()))
+            .update({User.calendar_version: User.calendar_version + 1}, synchronize_session=False)
+    )
@@ -0,0 +1,337 @@
+"""
+Cola de trabajos en segundo plano guardada en la misma base de datos.
+
+Los endpoints llaman a enqueue() dentro de su transacción y responden de
+inmediato; `flask worker` reclama los trabajos pendientes y ejecuta el
+handler registrado con @job(nombre).
+
+Reclamo de trabajos:
+- MySQL: SELECT ... FOR UPDATE SKIP LOCKED, así varios workers no se bloquean entre sí.
+- SQLite: no hay bloqueo por fila; se usa un UPDATE condicional (status='queued')
+  y solo gana el worker cuyo UPDATE afecta una fila.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import ScriptInfo, with_appcontext
+from sqlalchemy import or_, and_, func
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .models     import Job, Comment, EventRatingCount
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def job(nombre):
+    """Registra una función como handler del trabajo `nombre`. Recibe el payload como kwargs."""
+    def decorador(fn):
+        _handlers[nombre] = fn
+        return fn
+    return decorador
+
+
+def enqueue(nombre, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Agrega un trabajo a la sesión actual; se guarda con el commit del llamador.
+    Si `key` ya existe se devuelve el trabajo existente en lugar de crear otro.
+
+    Con `key`, si otra petición concurrente gana la carrera solo se descarta el
+    INSERT del trabajo y la escritura del llamador sigue intacta:
+    - MySQL: INSERT dentro de un SAVEPOINT; ante IntegrityError se deshace solo el savepoint.
+    - SQLite: INSERT ... ON CONFLICT DO NOTHING. pysqlite no anida SAVEPOINT dentro
+      de la transacción del llamador sin cambiar su modo de transacciones.
+    """
+    valores = dict(
+        name=nombre,
+        payload=json.dumps(payload or {}),
+        idempotency_key=key,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts or current_app.config["JOBS_MAX_ATTEMPTS"]
+    )
+    if not key:
+        j = Job(**valores)
+        db.session.add(j)
+        return j
+
+    existente = Job.query.filter_by(idempotency_key=key).first()
+    if existente:
+        return existente
+
+    if db.session.get_bind().dialect.name == 'sqlite':
+        db.session.execute(
+            sqlite.insert(Job).values(**valores).on_conflict_do_nothing(index_elements=[Job.idempotency_key])
+        )
+        return Job.query.filter_by(idempotency_key=key).one()
+
+    j = Job(**valores)
+    try:
+        with db.session.begin_nested():
+            db.session.add(j)
+    except IntegrityError:
+        # Lectura con bloqueo: ve la fila que confirmó la otra transacción
+        return Job.query.filter_by(idempotency_key=key).with_for_update().one()
+    return j
+
+
+def _claimable(ahora, lease):
+    # Pendientes ya vencidos, o en ejecución cuyo worker dejó de renovar locked_at
+    # (el heartbeat de run_job lo renueva mientras el handler corre; si no, el worker se cayó)
+    return or_(
+        and_(Job.status == 'queued', Job.run_at <= ahora),
+        and_(Job.status == 'running', Job.locked_at < ahora - timedelta(seconds=lease))
+    )
+
+
+def claim(worker_id):
+    """Reclama el siguiente trabajo disponible o devuelve None."""
+    ahora = datetime.utcnow()
+    lease = current_app.config["JOBS_LEASE_SECONDS"]
+    base = Job.query.filter(_claimable(ahora, lease)).order_by(Job.run_at.asc(), Job.id.asc())
+
+    if db.session.get_bind().dialect.name == 'mysql':
+        j = base.with_for_update(skip_locked=True).first()
+        if not j:
+            db.session.rollback()
+            return None
+        j.status    = 'running'
+        j.locked_by = worker_id
+        j.locked_at = ahora
+        j.attempts  = j.attempts + 1
+        db.session.commit()
+        return j
+
+    for candidato_id, in base.with_entities(Job.id).limit(5).all():
+        tomado = (
+            Job.query
+                .filter(Job.id == candidato_id, _claimable(ahora, lease))
+                .update({
+                    Job.status:    'running',
+                    Job.locked_by: worker_id,
+                    Job.locked_at: ahora,
+                    Job.attempts:  Job.attempts + 1
+                }, synchronize_session=False)
+        )
+        db.session.commit()
+        if tomado:
+            return Job.query.get(candidato_id)
+    return None
+
+
+def _backoff(intentos):
+    base = current_app.config["JOBS_BACKOFF_BASE"]
+    espera = min(base * 2 ** (intentos - 1), 3600)
+    return espera + random.uniform(0, espera / 10)
+
+
+def _heartbeat(app, job_id, worker_id, stop):
+    """Renueva locked_at mientras el handler corre, para que otro worker no reclame el trabajo."""
+    intervalo = app.config["JOBS_LEASE_SECONDS"] / 3
+    while not stop.wait(intervalo):
+        with app.app_context():
+            try:
+                (
+                    Job.query
+                        .filter(Job.id == job_id, Job.locked_by == worker_id)
+                        .update({Job.locked_at: datetime.utcnow()}, synchronize_session=False)
+                )
+                db.session.commit()
+            except Exception as ex:
+                db.session.rollback()
+                logger.error(f"Heartbeat del trabajo {job_id} falló: {ex}", exc_info=True)
+
+
+def _finish(job_id, worker_id, valores):
+    """
+    Deja el resultado solo si el trabajo sigue siendo de este worker.
+    Devuelve False si otro worker lo reclamó mientras tanto.
+    """
+    valores.update({Job.locked_by: None, Job.locked_at: None})
+    propio = (
+        Job.query
+            .filter(Job.id == job_id, Job.locked_by == worker_id)
+            .update(valores, synchronize_session=False)
+    )
+    db.session.commit()
+    if not propio:
+        logger.warning(f"Trabajo {job_id}: {worker_id} perdió el lease, no se guarda el resultado")
+    return bool(propio)
+
+
+def run_job(j, worker_id):
+    """Ejecuta un trabajo ya reclamado y deja registrado el resultado o el reintento."""
+    job_id, nombre, intentos, max_intentos = j.id, j.name, j.attempts, j.max_attempts
+
+    # Reclamado otra vez tras agotar sus intentos (el worker anterior se cayó): no se vuelve a correr
+    if intentos > max_intentos:
+        logger.error(f"Trabajo {job_id} ({nombre}) agotó sus intentos sin terminar")
+        _finish(job_id, worker_id, {
+            Job.status:     'failed',
+            Job.last_error: "Se agotaron los intentos (el worker dejó de responder)"
+        })
+        return False
+
+    app = current_app._get_current_object()
+    parar = threading.Event()
+    latido = threading.Thread(target=_heartbeat, args=(app, job_id, worker_id, parar), daemon=True)
+    latido.start()
+    try:
+        handler = _handlers.get(nombre)
+        if handler is None:
+            raise LookupError(f"No hay handler registrado para '{nombre}'")
+        handler(**json.loads(j.payload or "{}"))
+    except Exception as ex:
+        db.session.rollback()
+        error = f"{type(ex).__name__}: {ex}"
+        if intentos >= max_intentos:
+            logger.error(f"Trabajo {job_id} ({nombre}) falló definitivamente: {ex}", exc_info=True)
+            _finish(job_id, worker_id, {Job.status: 'failed', Job.last_error: error})
+        else:
+            logger.warning(f"Trabajo {job_id} ({nombre}) falló, reintento {intentos}/{max_intentos}: {ex}")
+            _finish(job_id, worker_id, {
+                Job.status:     'queued',
+                Job.last_error: error,
+                Job.run_at:     datetime.utcnow() + timedelta(seconds=_backoff(intentos))
+            })
+        return False
+    finally:
+        parar.set()
+        latido.join()
+
+    return _finish(job_id, worker_id, {Job.status: 'done', Job.last_error: None})
+
+
+def work(app, worker_id, stop, poll_interval):
+    """Bucle de un worker: reclama y ejecuta trabajos hasta que `stop` se active."""
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                j = claim(worker_id)
+                if j:
+                    run_job(j, worker_id)
+            except Exception as ex:
+                db.session.rollback()
+                j = None
+                logger.error(f"Error en worker {worker_id}: {ex}", exc_info=True)
+        if not j:
+            stop.wait(poll_interval)
+
+
+def _process_main(app_import_path, worker_id, poll_interval):
+    app = ScriptInfo(app_import_path=app_import_path).load_app()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        work(app, worker_id, stop, poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Handlers
+# ---------------------------------------------------------------------------
+
+@job('ratings.rebuild')
+def rebuild_rating_counts(event_id):
+    """Recalcula el histograma event_rating_counts de un evento a partir de sus comentarios."""
+    filas = (
+        db.session.query(Comment.rating, func.count(Comment.id))
+            .filter(Comment.event_id == event_id, Comment.rating.between(1, 5))
+            .group_by(Comment.rating)
+            .all()
+    )
+    EventRatingCount.query.filter_by(event_id=event_id).delete(synchronize_session=False)
+    db.session.add_all(
+        EventRatingCount(event_id=event_id, rating=rating, count=total)
+        for rating, total in filas
+    )
+    db.session.commit()
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+@click.command('worker')
+@click.option('--concurrency', '-c', type=int, default=None, help="Cantidad de hilos/procesos.")
+@click.option('--mode', type=click.Choice(['thread', 'process']), default=None, help="Pool de hilos o de procesos.")
+@click.option('--poll-interval', type=float, default=None, help="Segundos de espera cuando la cola está vacía.")
+@click.pass_context
+@with_appcontext
+def worker_command(ctx, concurrency, mode, poll_interval):
+    """Ejecuta los trabajos en segundo plano de la cola."""
+    app = current_app._get_current_object()
+    concurrency   = concurrency or app.config["JOBS_WORKER_CONCURRENCY"]
+    mode          = mode or app.config["JOBS_WORKER_MODE"]
+    poll_interval = poll_interval or app.config["JOBS_POLL_INTERVAL"]
+    prefijo = f"{socket.gethostname()}:{os.getpid()}"
+
+    click.echo(f"Worker iniciado: {concurrency} x {mode}")
+
+    if mode == 'process':
+        app_import_path = ctx.ensure_object(ScriptInfo).app_import_path
+        procesos = [
+            multiprocessing.Process(target=_process_main, args=(app_import_path, f"{prefijo}:{i}", poll_interval))
+            for i in range(concurrency)
+        ]
+        for p in procesos:
+            p.start()
+        try:
+            for p in procesos:
+                p.join()
+        except KeyboardInterrupt:
+            for p in procesos:
+                p.terminate()
+            for p in procesos:
+                p.join()
+        return
+
+    stop = threading.Event()
+    hilos = [
+        threading.Thread(target=work, args=(app, f"{prefijo}:{i}", stop, poll_interval), daemon=True)
+        for i in range(concurrency)
+    ]
+    for h in hilos:
+        h.start()
+    try:
+        while any(h.is_alive() for h in hilos):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for h in hilos:
+            h.join()
+
+
+@click.command('enqueue')
+@click.argument('nombre')
+@click.option('--payload', default='{}', help="Argumentos del trabajo en JSON.")
+@click.option('--key', default=None, help="Clave de idempotencia.")
+@with_appcontext
+def enqueue_command(nombre, payload, key):
+    """
+    Encola un trabajo manualmente.
+
+    Ejemplo: flask enqueue ratings.rebuild --payload '{"event_id": 1}'
+    """
+    j = enqueue(nombre, json.loads(payload), key=key)
+    db.session.commit()
+    click.echo(f"Trabajo {j.id} encolado ({j.status})")
+
+
+def init_app(app):
+    app.cli.add_command(worker_command)
+    app.cli.add_command(enqueue_command)
@@ -9,6 +9,8 @@ class User(db.Model):
     first_name    = db.Column(db.String(50), nullable=False)
     last_name     = db.Column(db.String(50), nullable=False)
     age           = db.Column(db.SmallInteger)
+    calendar_token = db.Column(db.String(64), unique=True)
+    calendar_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
     created_at    = db.Column(db.DateTime, default=datetime.utcnow)
 
     events   = db.relationship('Event', back_populates='creator', cascade="all, delete-orphan")
@@ -37,6 +39,11 @@ class Event(db.Model):
     comments = db.relationship("Comment", back_populates="event", cascade="all, delete-orphan")
     rsvps    = db.relationship("RSVP", back_populates="event", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index("ix_events_event_date", "event_date"),
+        db.Index("ix_events_creator_id_event_date", "creator_id", "event_date"),
+    )
+
 class RSVP(db.Model):
     __tablename__ = "rsvps"
     id           = db.Column(db.Integer, primary_key=True)
@@ -49,6 +56,12 @@ class RSVP(db.Model):
     user  = db.relationship("User", back_populates="rsvps")
     event = db.relationship("Event", back_populates="rsvps")
 
+    __table_args__ = (
+        # event_id al final: la agenda del usuario se resuelve solo con el índice
+        db.Index("ix_rsvps_user_id_status_event_id", "user_id", "status", "event_id"),
+        db.Index("ix_rsvps_event_id_status", "event_id", "status"),
+    )
+
 class Comment(db.Model):
     __tablename__ = "comments"
     id         = db.Column(db.Integer, primary_key=True)
@@ -60,6 +73,10 @@ class Comment(db.Model):
 
     user  = db.relationship("User", back_populates="comments")
     event = db.relationship("Event", back_populates="comments")
+
+    __table_args__ = (
+        db.Index("ix_comments_event_created_id", "event_id", "created_at", "id"),
+    )
     
     def seed_license_types():
    
@@ -80,4 +97,34 @@ class Comment(db.Model):
             lt = LicenseType(code=lic["code"], description=lic["description"])
             db.session.add(lt)
 
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+
+class EventRatingCount(db.Model):
+    """Histograma de calificaciones: una fila por (evento, estrellas), se incrementa en cada comentario."""
+    __tablename__ = "event_rating_counts"
+    event_id = db.Column(db.Integer, db.ForeignKey("events.id"), primary_key=True)
+    rating   = db.Column(db.SmallInteger, primary_key=True)
+    count    = db.Column(db.Integer, default=0, nullable=False)
+
+
+class Job(db.Model):
+    """Trabajo en segundo plano (ver app/jobs.py)."""
+    __tablename__ = "jobs"
+    id              = db.Column(db.Integer, primary_key=True)
+    name            = db.Column(db.String(100), nullable=False)
+    payload         = db.Column(db.Text, nullable=False, default="{}")
+    status          = db.Column(db.Enum('queued','running','done','failed'), default='queued', nullable=False)
+    idempotency_key = db.Column(db.String(191), unique=True)
+    attempts        = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts    = db.Column(db.Integer, default=5, nullable=False)
+    run_at          = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by       = db.Column(db.String(100))
+    locked_at       = db.Column(db.DateTime)
+    last_error      = db.Column(db.Text)
+    created_at      = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at      = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
@@ -0,0 +1,463 @@
+"""
+Revisión de planes de consulta (`flask --app run explain-queries`).
+
+Ejecuta todas las rutas de la app con el cliente de pruebas dentro de una
+transacción que nunca se confirma: la sesión se une a una transacción abierta
+en una conexión propia y cada commit() de las rutas solo libera un SAVEPOINT.
+Al final se deshace todo. Captura el SQL emitido y corre EXPLAIN sobre cada
+consulta: EXPLAIN en MySQL y EXPLAIN QUERY PLAN en SQLite.
+
+Se marcan los recorridos completos de tabla y los ordenamientos en archivo
+temporal (filesort / TEMP B-TREE), se proponen los índices faltantes y, con
+--write-migration, se genera la migración de Alembic correspondiente.
+Con --strict el comando termina con código 1 si algún plan se degradó o alguna
+ruta falló, para usarlo como control en CI. Las rutas que dependen de SQL propio
+de un motor se declaran en SKIP_DIALECTS y se omiten explícitamente en los demás.
+"""
+
+import json
+import os
+import re
+import secrets
+import sys
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_jwt_extended import create_access_token
+from flask_sqlalchemy.query import Query
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from .extensions import db, bcrypt
+from .models     import User, LicenseType, Event, RSVP, Comment
+from .           import ics
+
+# Tablas de catálogo pequeñas donde un recorrido completo es aceptable
+SMALL_TABLES = {"license_types"}
+
+PASSWORD = "explain-queries"
+
+# (método, regla de la ruta, ruta con marcadores, cuerpo JSON o texto crudo)
+# El orden importa: el RSVP se crea antes de consultarlo y se borra al final.
+# {cursor} es el X-Next-Cursor de la respuesta anterior, así la segunda página
+# pasa el predicado de keyset por EXPLAIN.
+SCENARIOS = [
+    ('POST',   '/auth/register',                'auth/register',          lambda f: {"username": f["new_username"], "password": PASSWORD, "first_name": "Plan", "last_name": "Check"}),
+    ('POST',   '/auth/login',                   'auth/login',             lambda f: {"username": f["username"], "password": PASSWORD}),
+    ('GET',    '/me',                           'me',                     None),
+    ('GET',    '/calendar/<token>.ics',         'calendar/{token}.ics',   None),
+    ('GET',    '/me/agenda',                    'me/agenda?limit=1&from={agenda_from}&to={agenda_to}', None),
+    ('GET',    '/me/agenda',                    'me/agenda?limit=1&from={agenda_from}&to={agenda_to}&cursor={cursor}', None),
+    ('GET',    '/me/calendar',                  'me/calendar',            None),
+    ('POST',   '/me/calendar',                  'me/calendar',            None),
+    ('GET',    '/events',                       'events',                 None),
+    ('POST',   '/events',                       'events',                 lambda f: {"title": "Plan", "event_date": f["future_date"], "license_code": f["license_code"]}),
+    ('POST',   '/events/import',                'events/import?format=jsonl', lambda f: json.dumps({"title": "Plan", "event_date": f["future_date"], "license_code": f["license_code"]}) + "\n"),
+    ('GET',    '/my-events',                    'my-events',              None),
+    ('GET',    '/my-created-events',            'my-created-events',      None),
+    ('GET',    '/events/<int:event_id>',        'events/{future}',        None),
+    ('PUT',    '/events/<int:event_id>',        'events/{future}',        lambda f: {"title": "Plan", "event_date": f["future_date"]}),
+    ('GET',    '/notifications',                'notifications',          None),
+    ('GET',    '/license-types',                'license-types',          None),
+    ('GET',    '/stats',                        'stats',                  None),
+    ('POST',   '/rsvps/<int:event_id>',         'rsvps/{future}',         None),
+    ('GET',    '/rsvps/<int:event_id>',         'rsvps/{future}',         None),
+    ('DELETE', '/rsvps/<int:event_id>',         'rsvps/{future}',         None),
+    ('POST',   '/comments/<int:event_id>',      'comments/{past}',        lambda f: {"rating": 5, "content": "Plan"}),
+    ('GET',    '/comments/<int:event_id>',      'comments/{past}?limit=1', None),
+    ('GET',    '/comments/<int:event_id>',      'comments/{past}?limit=1&cursor={cursor}', None),
+    ('GET',    '/comments/<int:event_id>/summary', 'comments/{past}/summary', None),
+    ('GET',    '/history',                      'history',                None),
+]
+
+# Escenarios que solo funcionan en algunos motores: (método, regla) -> {dialecto: motivo}
+SKIP_DIALECTS = {
+    ('GET', '/stats'): {"sqlite": "usa la vista event_stats y NOW() de MySQL"},
+}
+
+
+def skipped(dialecto):
+    """Devuelve [(ruta, motivo)] de los escenarios omitidos en el motor indicado."""
+    return [
+        (f"{metodo} {regla}", motivos[dialecto])
+        for (metodo, regla), motivos in SKIP_DIALECTS.items()
+        if dialecto in motivos
+    ]
+
+
+def _seed():
+    """
+    Crea (sin confirmar) un usuario, un evento pasado y uno futuro para recorrer las rutas,
+    más lo necesario para que la agenda y los comentarios tengan una segunda página.
+    """
+    lic = LicenseType.query.first()
+    if not lic:
+        lic = LicenseType(code="CC-BY", description="Creative Commons Attribution")
+        db.session.add(lic)
+
+    sufijo = secrets.token_hex(4)
+    u = User(
+        username=f"qp_{sufijo}",
+        password_hash=bcrypt.generate_password_hash(PASSWORD).decode(),
+        first_name="Plan",
+        last_name="Check",
+        calendar_token=secrets.token_urlsafe(32)
+    )
+    db.session.add(u)
+    db.session.flush()
+
+    ahora = datetime.utcnow()
+    pasado = Event(creator_id=u.id, title="Plan pasado", event_date=ahora - timedelta(days=1), license_code=lic.code)
+    futuro = Event(creator_id=u.id, title="Plan futuro", event_date=ahora + timedelta(days=30), license_code=lic.code)
+    agenda = [
+        Event(creator_id=u.id, title=f"Plan agenda {i}", event_date=ahora + timedelta(days=40 + i), license_code=lic.code)
+        for i in range(2)
+    ]
+    db.session.add_all([pasado, futuro, *agenda])
+    db.session.flush()
+
+    db.session.add(RSVP(user_id=u.id, event_id=pasado.id, status='accepted', responded_at=ahora))
+    db.session.add_all(RSVP(user_id=u.id, event_id=e.id, status='accepted', responded_at=ahora) for e in agenda)
+    db.session.add(Comment(user_id=u.id, event_id=pasado.id, rating=4, content="Plan", created_at=ahora - timedelta(hours=1)))
+    db.session.flush()
+
+    return {
+        "user_id":      u.id,
+        "username":     u.username,
+        "new_username": f"qp_new_{sufijo}",
+        "token":        u.calendar_token,
+        "license_code": lic.code,
+        "past":         pasado.id,
+        "future":       futuro.id,
+        "future_date":  (ahora + timedelta(days=31)).replace(microsecond=0).isoformat(),
+        "agenda_from":  quote((ahora + timedelta(days=35)).replace(microsecond=0).isoformat()),
+        "agenda_to":    quote((ahora + timedelta(days=50)).replace(microsecond=0).isoformat()),
+    }
+
+
+def replay(app):
+    """
+    Recorre todas las rutas con datos de prueba y devuelve
+    (consultas, rutas_sin_escenario, errores). Nada queda guardado en la base.
+    """
+    capturadas = OrderedDict()
+    errores = []
+    ruta_actual = [None]
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not ruta_actual[0]:
+            return
+        entrada = capturadas.setdefault(statement, {"parameters": parameters, "routes": []})
+        if ruta_actual[0] not in entrada["routes"]:
+            entrada["routes"].append(ruta_actual[0])
+
+    cubiertas = {(metodo, regla) for metodo, regla, _, _ in SCENARIOS}
+    sin_escenario = sorted(
+        f"{metodo} {regla.rule}"
+        for regla in app.url_map.iter_rules() if regla.endpoint != 'static'
+        for metodo in regla.methods - {'HEAD', 'OPTIONS'}
+        if (metodo, regla.rule) not in cubiertas
+    )
+    reglas = {(metodo, r.rule) for r in app.url_map.iter_rules() for metodo in r.methods}
+
+    datos = None
+
+    # Un solo contexto de app, así todas las peticiones comparten la sesión
+    with app.app_context():
+        sesion = db.session
+        conexion = db.engine.connect()
+        transaccion = conexion.begin()
+        if conexion.dialect.name == 'sqlite':
+            # pysqlite no abre la transacción antes de un SAVEPOINT; sin BEGIN, el RELEASE confirmaría
+            conexion.exec_driver_sql("BEGIN")
+
+        # Sesión unida a la transacción de `conexion`: los commit() de las rutas solo
+        # liberan un SAVEPOINT y el rollback final deshace todo
+        db.session = scoped_session(sessionmaker(
+            bind=conexion,
+            join_transaction_mode="create_savepoint",
+            query_cls=Query
+        ))
+        try:
+            datos = _seed()
+            headers = {"Authorization": f"Bearer {create_access_token(identity=str(datos['user_id']))}"}
+            cliente = app.test_client()
+            omitidas = {ruta for ruta, _ in skipped(conexion.dialect.name)}
+            event.listen(conexion, "after_cursor_execute", capturar)
+            try:
+                for metodo, regla, ruta, cuerpo in SCENARIOS:
+                    if (metodo, regla) not in reglas or f"{metodo} {regla}" in omitidas:
+                        continue
+                    ruta_actual[0] = f"{metodo} {regla}"
+                    try:
+                        contenido = cuerpo(datos) if cuerpo else None
+                        resp = cliente.open(
+                            "/" + ruta.format(**datos),
+                            method=metodo,
+                            headers=headers,
+                            **({"data": contenido} if isinstance(contenido, str) else {"json": contenido})
+                        )
+                        if resp.status_code >= 400:
+                            detalle = (resp.get_json(silent=True) or {}).get("error", "")
+                            errores.append(f"{ruta_actual[0]} -> {resp.status_code} {detalle}".rstrip())
+                        if resp.headers.get("X-Next-Cursor"):
+                            datos["cursor"] = quote(resp.headers["X-Next-Cursor"], safe="")
+                    except KeyError as ex:
+                        errores.append(f"{ruta_actual[0]} -> falta {ex} (¿la respuesta anterior no trajo X-Next-Cursor?)")
+                    except Exception as ex:
+                        errores.append(f"{ruta_actual[0]} -> {type(ex).__name__}: {ex}")
+                    ruta_actual[0] = None
+            finally:
+                event.remove(conexion, "after_cursor_execute", capturar)
+
+            consultas = []
+            for statement, info in capturadas.items():
+                if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                try:
+                    plan = explain(statement, info["parameters"])
+                except Exception as ex:
+                    errores.append(f"EXPLAIN ({', '.join(info['routes'])}) -> {type(ex).__name__}: {ex}")
+                    continue
+                consultas.append({
+                    "statement": statement,
+                    "routes":    info["routes"],
+                    "plan":      plan,
+                    "problems":  problems(plan),
+                    "full_scan": any(p["full_scan"] and p["table"] not in SMALL_TABLES for p in plan),
+                })
+        finally:
+            db.session.remove()
+            db.session = sesion
+            transaccion.rollback()
+            conexion.close()
+            if datos:
+                ics.forget(datos["token"])
+
+    return consultas, sin_escenario, errores
+
+
+def explain(statement, parameters):
+    """Devuelve el plan como lista de dicts con 'table', 'detail', 'full_scan' y 'filesort'."""
+    conn = db.session.connection()
+    dialecto = conn.dialect.name
+
+    if dialecto == 'sqlite':
+        filas = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        plan = []
+        for fila in filas:
+            detalle = fila[-1]
+            m = re.match(r"SCAN (?:TABLE )?(\w+)(.*)", detalle)
+            plan.append({
+                "table":     m.group(1) if m else None,
+                "detail":    detalle,
+                "full_scan": bool(m) and "INDEX" not in m.group(2) and "PRIMARY KEY" not in m.group(2),
+                "filesort":  "TEMP B-TREE FOR ORDER BY" in detalle,
+            })
+        return plan
+
+    if dialecto == 'mysql':
+        filas = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+        return [
+            {
+                "table":     fila.get("table"),
+                "detail":    f"type={fila.get('type')} key={fila.get('key')} rows={fila.get('rows')} extra={fila.get('Extra')}",
+                "full_scan": fila.get("type") == "ALL",
+                "filesort":  "filesort" in (fila.get("Extra") or ""),
+            }
+            for fila in filas
+        ]
+
+    raise click.ClickException(f"EXPLAIN no soportado para el dialecto '{dialecto}'")
+
+
+def problems(plan):
+    encontrados = []
+    for paso in plan:
+        if paso["full_scan"] and paso["table"] not in SMALL_TABLES:
+            encontrados.append(f"recorrido completo de {paso['table']}")
+        if paso["filesort"] and paso["table"] not in SMALL_TABLES:
+            encontrados.append(f"ordenamiento en archivo temporal ({paso['table'] or 'resultado'})")
+    return encontrados
+
+
+def suggest_index(statement, tabla):
+    """
+    Propone las columnas de un índice para `tabla` a partir del SQL:
+    primero las de igualdad, luego una de rango o, si no hay, las del ORDER BY.
+    Devuelve (columnas_de_igualdad, columnas_restantes) o None.
+    Las igualdades de JOIN contra otra tabla solo cuentan si `tabla` es la unida (JOIN tabla ON ...);
+    si está en el FROM es la que se recorre y esas columnas no ayudan.
+    """
+    def columnas(patron, texto):
+        vistas = []
+        for col in re.findall(patron, texto):
+            if col not in vistas:
+                vistas.append(col)
+        return vistas
+
+    t = re.escape(tabla)
+    donde, _, orden = statement.partition("ORDER BY")
+    if re.search(rf"JOIN {t}\b", donde):
+        igualdad = columnas(rf"\b{t}\.(\w+)\s*(?:=|IN\b|IS\b)", donde)
+    else:
+        igualdad = columnas(rf"\b{t}\.(\w+)\s*(?:=(?!\s*\w+\.\w)|IN\b|IS\b)", donde)
+    rango    = columnas(rf"\b{t}\.(\w+)\s*(?:<|>|BETWEEN\b)", donde)
+    ordenar  = columnas(rf"\b{t}\.(\w+)", orden.split("LIMIT")[0])
+
+    resto = [c for c in (rango[:1] or ordenar) if c not in igualdad]
+    if not (igualdad or resto) or (igualdad + resto)[0] == "id":
+        return None
+    return igualdad, resto
+
+
+def _covers(indice, igualdad, resto):
+    # Las columnas de igualdad pueden ir en cualquier orden al inicio del índice
+    n = len(igualdad)
+    return set(indice[:n]) == set(igualdad) and indice[n:n + len(resto)] == resto
+
+
+def advise(consultas):
+    """Devuelve {nombre: (tabla, columnas)} con los índices que faltan para las consultas marcadas."""
+    insp = inspect(db.session.connection())
+    existentes = {}
+    candidatos = []
+
+    for c in consultas:
+        for paso in c["plan"]:
+            tabla = paso["table"]
+            if not tabla or tabla in SMALL_TABLES or not (paso["full_scan"] or paso["filesort"]):
+                continue
+            sugerido = suggest_index(c["statement"], tabla)
+            if not sugerido:
+                continue
+
+            if tabla not in existentes:
+                indices = [ix["column_names"] for ix in insp.get_indexes(tabla)]
+                indices.append(insp.get_pk_constraint(tabla)["constrained_columns"])
+                existentes[tabla] = indices
+            if any(_covers(ix, *sugerido) for ix in existentes[tabla]):
+                continue
+            candidatos.append((tabla, *sugerido))
+
+    # Los más largos primero: un índice más amplio puede cubrir a otro más corto,
+    # o absorberlo reordenando sus columnas de igualdad
+    grupos = []   # [tabla, columnas, [(igualdad, resto) cubiertos]]
+    for tabla, igualdad, resto in sorted(candidatos, key=lambda c: -len(c[1] + c[2])):
+        for grupo in grupos:
+            if grupo[0] != tabla:
+                continue
+            if _covers(grupo[1], igualdad, resto):
+                grupo[2].append((igualdad, resto))
+                break
+            cols = _merge(grupo[1], grupo[2], igualdad, resto)
+            if cols:
+                grupo[1] = cols
+                grupo[2].append((igualdad, resto))
+                break
+        else:
+            grupos.append([tabla, igualdad + resto, [(igualdad, resto)]])
+
+    propuestas = OrderedDict()
+    for tabla, cols, _ in grupos:
+        propuestas[f"ix_{tabla}_{'_'.join(cols)}"] = (tabla, cols)
+    return propuestas
+
+
+def _merge(cols, cubiertos, igualdad, resto):
+    """
+    Intenta un solo índice para las consultas ya cubiertas por `cols` y la nueva.
+    Las igualdades de la nueva van primero, luego su resto y después las demás columnas
+    de `cols`; sirve si todas siguen cubiertas (sus igualdades solo cambian de orden).
+    Devuelve las columnas o None.
+    """
+    prefijo = igualdad + resto
+    if not set(prefijo) <= set(cols):
+        return None
+    unidas = prefijo + [c for c in cols if c not in prefijo]
+    if all(_covers(unidas, *c) for c in cubiertos):
+        return unidas
+    return None
+
+
+def migration_ops(propuestas):
+    """Devuelve las líneas de upgrade() y downgrade(), ya indentadas para el cuerpo de la función."""
+    upgrades = "\n    ".join(
+        f"op.create_index('{nombre}', '{tabla}', {cols!r})"
+        for nombre, (tabla, cols) in propuestas.items()
+    )
+    downgrades = "\n    ".join(
+        f"op.drop_index('{nombre}', table_name='{tabla}')"
+        for nombre, (tabla, cols) in reversed(propuestas.items())
+    )
+    return upgrades, downgrades
+
+
+def write_migration_file(propuestas):
+    from alembic import util
+    from alembic.script import ScriptDirectory
+
+    migrate_ext = current_app.extensions["migrate"]
+    if not os.path.isdir(migrate_ext.directory):
+        raise click.ClickException(f"No existe la carpeta '{migrate_ext.directory}'. Ejecuta primero `flask db init`.")
+    config = migrate_ext.migrate.get_config(migrate_ext.directory)
+    script = ScriptDirectory.from_config(config)
+    upgrades, downgrades = migration_ops(propuestas)
+    rev = script.generate_revision(
+        util.rev_id(),
+        "indices sugeridos por explain-queries",
+        head="head",
+        upgrades=upgrades,
+        downgrades=downgrades
+    )
+    return rev.path
+
+
+@click.command('explain-queries')
+@click.option('--strict', is_flag=True, help="Termina con código 1 si algún plan hace un recorrido completo de tabla o alguna ruta falla.")
+@click.option('--write-migration', is_flag=True, help="Genera una migración de Alembic con los índices sugeridos.")
+@click.option('--verbose', '-v', is_flag=True, help="Muestra el plan completo de cada consulta.")
+@with_appcontext
+def explain_queries_command(strict, write_migration, verbose):
+    """Ejecuta EXPLAIN sobre las consultas de todas las rutas y sugiere índices."""
+    app = current_app._get_current_object()
+    consultas, sin_escenario, errores = replay(app)
+
+    for c in consultas:
+        if not (verbose or c["problems"]):
+            continue
+        estado = "REVISAR" if c["problems"] else "ok"
+        click.echo(f"[{estado}] {', '.join(c['routes'])}")
+        click.echo("    " + " ".join(c["statement"].split())[:300])
+        for paso in c["plan"]:
+            click.echo(f"      {paso['detail']}")
+        for p in c["problems"]:
+            click.echo(click.style(f"      ! {p}", fg="yellow"))
+
+    marcadas = [c for c in consultas if c["problems"]]
+    click.echo(f"\n{len(consultas)} consultas revisadas, {len(marcadas)} con problemas.")
+
+    for ruta in sin_escenario:
+        click.echo(click.style(f"Ruta sin escenario en SCENARIOS: {ruta}", fg="yellow"))
+    for ruta, motivo in skipped(db.session.get_bind().dialect.name):
+        click.echo(f"Ruta omitida en este motor: {ruta} ({motivo})")
+    for error in errores:
+        click.echo(click.style(f"Error al ejecutar {error}", fg="red"))
+
+    propuestas = advise(marcadas)
+    if propuestas:
+        upgrades, _ = migration_ops(propuestas)
+        click.echo("\nÍndices sugeridos:\n    " + upgrades)
+        if write_migration:
+            click.echo(f"Migración creada: {write_migration_file(propuestas)}")
+
+    if strict and (any(c["full_scan"] for c in consultas) or sin_escenario or errores):
+        sys.exit(1)
+
+
+def init_app(app):
+    app.cli.add_command(explain_queries_command)
@@ -0,0 +1,24 @@
+import pytest
+
+from app.config import Config
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """App de run.py sobre SQLite en memoria, con la licencia CC-BY cargada."""
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", "sqlite://")
+    monkeypatch.setattr(Config, "JWT_SECRET_KEY", "pruebas-" + "x" * 32)
+    # run.py abre error.log en el directorio actual al importarse
+    monkeypatch.chdir(tmp_path)
+    from run import create_app
+    from app.extensions import db
+    from app.models import LicenseType
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(LicenseType(code="CC-BY", description="Creative Commons Attribution"))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.drop_all()
@@ -1,14 +1,16 @@
 # run.py
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask import Flask, request, jsonify, url_for, make_response
 from flask_jwt_extended import (
     JWTManager, create_access_token,
     jwt_required, get_jwt_identity
 )
 
 import logging
-from sqlalchemy import text
+import secrets
+from sqlalchemy import text, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import mysql, sqlite
 from datetime import datetime, timezone
 
 error_logger = logging.getLogger('error_logger')
@@ -22,19 +24,76 @@ from datetime import datetime, timezone
 
 from app.config     import Config
 from app.extensions import db, migrate, jwt, bcrypt, cors
-from app.models     import User, LicenseType, Event, RSVP, Comment
+from app.models     import User, LicenseType, Event, RSVP, Comment, EventRatingCount
+from app            import ics, jobs, query_plans, bulk
+from app.dates      import parse_utc
+
+PAGE_SIZE     = 50
+PAGE_SIZE_MAX = 200
+
+
+def parse_cursor(cursor):
+    """
+    Decodifica un cursor de paginación con formato '<fecha ISO>,<id>'.
+    Devuelve (datetime, id) o lanza ValueError si el formato es inválido.
+    """
+    fecha, _, ident = cursor.rpartition(',')
+    return datetime.fromisoformat(fecha), int(ident)
+
+
+def make_cursor(fecha, ident):
+    return f"{fecha.isoformat()},{ident}"
+
+
+def increment_rating_count(event_id, rating):
+    """
+    Suma 1 a la fila (evento, estrellas) del histograma con un upsert del dialecto,
+    así dos primeros comentarios simultáneos no chocan con la clave primaria.
+    En otros motores: UPDATE y, si no había fila, INSERT dentro de un SAVEPOINT.
+    """
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto == 'mysql':
+        stmt = mysql.insert(EventRatingCount).values(event_id=event_id, rating=rating, count=1)
+        stmt = stmt.on_duplicate_key_update(count=EventRatingCount.count + 1)
+    elif dialecto == 'sqlite':
+        stmt = sqlite.insert(EventRatingCount).values(event_id=event_id, rating=rating, count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[EventRatingCount.event_id, EventRatingCount.rating],
+            set_={"count": EventRatingCount.count + 1}
+        )
+    else:
+        sumar = (
+            EventRatingCount.__table__.update()
+                .where(EventRatingCount.event_id == event_id, EventRatingCount.rating == rating)
+                .values(count=EventRatingCount.count + 1)
+        )
+        if db.session.execute(sumar).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    EventRatingCount.__table__.insert().values(event_id=event_id, rating=rating, count=1)
+                )
+        except IntegrityError:
+            # Otro comentario creó la fila primero
+            db.session.execute(sumar)
+        return
+    db.session.execute(stmt)
+
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
-    CORS(app, resources={r"/*": {"origins": "*"}})
-
-    cors.init_app(app)
+    # Una sola instancia de CORS: con dos, la que no expone X-Next-Cursor contesta primero
+    cors.init_app(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor"])
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
     bcrypt.init_app(app)
+    jobs.init_app(app)
+    bulk.init_app(app)
+    query_plans.init_app(app)
 
     @app.route('/auth/register', methods=['POST'])
     def register():
@@ -106,6 +165,122 @@ def create_app():
         }), 200
 
 
+    @app.route('/me/calendar', methods=['GET', 'POST'])
+    @jwt_required()
+    def my_calendar():
+        """
+        Devuelve la URL de suscripción iCalendar del usuario autenticado.
+        GET la crea si no existe; POST genera un token nuevo e invalida el anterior.
+        """
+        user_id = get_jwt_identity()
+        u = User.query.get(user_id)
+        if not u:
+            return jsonify(error="Usuario no encontrado"), 404
+
+        if request.method == 'POST' or not u.calendar_token:
+            if u.calendar_token:
+                ics.forget(u.calendar_token)
+            u.calendar_token = secrets.token_urlsafe(32)
+            db.session.commit()
+
+        return jsonify({
+            "token": u.calendar_token,
+            "url":   url_for('calendar_feed', token=u.calendar_token, _external=True)
+        }), 200
+
+
+    @app.route('/calendar/<token>.ics', methods=['GET'])
+    def calendar_feed(token):
+        """
+        Feed iCalendar con los eventos a los que el usuario confirmó asistencia.
+        Se sirve desde caché mientras users.calendar_version no cambie y responde 304
+        si el cliente ya tiene esa versión (If-None-Match).
+        """
+        feed = ics.get_feed(token)
+        if not feed:
+            return jsonify(error="Calendario no encontrado"), 404
+
+        resp = make_response(feed["body"])
+        resp.mimetype = "text/calendar"
+        resp.charset = "utf-8"
+        resp.set_etag(feed["etag"])
+        resp.cache_control.private = True
+        resp.cache_control.max_age = 300
+        return resp.make_conditional(request)
+
+
+    @app.route('/me/agenda', methods=['GET'])
+    @jwt_required()
+    def my_agenda():
+        """
+        Devuelve los próximos eventos a los que el usuario autenticado confirmó asistencia,
+        ordenados por fecha. Solo incluye RSVPs aceptados, así que rsvp_status siempre es 'accepted'.
+        Filtros opcionales ?from=&to= (ISO); `from` nunca va al pasado: se usa el mayor entre
+        `from` y ahora. Paginación por cursor: ?limit=<n>&cursor=<valor de la cabecera X-Next-Cursor, expuesta por CORS>.
+        """
+        user_id = get_jwt_identity()
+
+        try:
+            ahora  = datetime.utcnow()
+            desde  = max(parse_utc(request.args['from']), ahora) if request.args.get('from') else ahora
+            hasta  = parse_utc(request.args['to']) if request.args.get('to') else None
+            limit  = min(int(request.args.get('limit', PAGE_SIZE)), PAGE_SIZE_MAX)
+            cursor = request.args.get('cursor')
+            after  = parse_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify(error="Parámetros inválidos. Use fechas 'YYYY-MM-DDTHH:MM:SS' y un cursor válido."), 400
+        if limit < 1:
+            return jsonify(error="Parámetros de paginación inválidos."), 400
+
+        # rsvps se lee solo del índice (user_id, status, event_id); events se busca por id
+        query = (
+            db.session.query(
+                Event.id,
+                Event.creator_id,
+                Event.title,
+                Event.description,
+                Event.event_date,
+                Event.location,
+                Event.license_code,
+                RSVP.status
+            )
+            .join(RSVP, RSVP.event_id == Event.id)
+            .filter(
+                RSVP.user_id == user_id,
+                RSVP.status == 'accepted',
+                Event.event_date >= desde
+            )
+        )
+        if hasta:
+            query = query.filter(Event.event_date < hasta)
+        if after:
+            # Sin comparar tuplas: MySQL no convierte (a, b) > (x, y) en un rango del índice
+            query = query.filter(or_(
+                Event.event_date > after[0],
+                and_(Event.event_date == after[0], Event.id > after[1])
+            ))
+
+        filas = query.order_by(Event.event_date.asc(), Event.id.asc()).limit(limit + 1).all()
+        pagina = filas[:limit]
+
+        resp = jsonify([
+            {
+                "id":           e.id,
+                "creator_id":   e.creator_id,
+                "title":        e.title,
+                "description":  e.description,
+                "event_date":   e.event_date.isoformat(),
+                "location":     e.location,
+                "license_code": e.license_code,
+                "rsvp_status":  e.status
+            } for e in pagina
+        ])
+        if len(filas) > limit:
+            ultimo = pagina[-1]
+            resp.headers['X-Next-Cursor'] = make_cursor(ultimo.event_date, ultimo.id)
+        return resp, 200
+
+
     @app.route('/events', methods=['GET'])
     @jwt_required()
     def list_events():
@@ -170,6 +345,31 @@ def create_app():
         return jsonify(msg="Evento creado", id=ev.id), 201
 
 
+    @app.route('/events/import', methods=['POST'])
+    @jwt_required()
+    def import_events_upload():
+        """
+        Importa eventos en bloque para el usuario autenticado desde un archivo CSV o JSON Lines,
+        enviado como multipart (campo 'file') o directamente en el cuerpo.
+        Devuelve cuántos se insertaron y los errores por número de fila.
+        """
+        user_id = get_jwt_identity()
+
+        formato = request.args.get('format')
+        if formato and formato not in bulk.FORMATS:
+            return jsonify(error="Formato inválido. Use 'csv' o 'jsonl'."), 400
+
+        try:
+            stream, formato = bulk.upload_stream(request)
+            resultado = bulk.import_events(stream, formato, int(user_id))
+        except Exception as ex:
+            db.session.rollback()
+            error_logger.error(f"Error en /events/import: {str(ex)}", exc_info=True)
+            return jsonify(error="No se pudo importar el archivo"), 500
+
+        return jsonify(resultado), 200
+
+
     @app.route('/my-events', methods=['GET'])
     @jwt_required()
     def my_events():
@@ -299,6 +499,9 @@ def create_app():
         ev.location     = location
         ev.license_code = license_code
 
+        # Los calendarios de los asistentes cambian en la misma transacción que el evento
+        ics.bump_event(event_id)
+
         try:
             db.session.commit()
             return jsonify(msg="Evento actualizado"), 200
@@ -434,6 +637,7 @@ def create_app():
             responded_at=datetime.utcnow()
         )
         db.session.add(r)
+        ics.bump(user_id)
         db.session.commit()
         return jsonify(msg="RSVP creado"), 201
 
@@ -453,6 +657,7 @@ def create_app():
             return jsonify(error="No puedes cancelar asistencia a un evento que ya pasó."), 400
 
         db.session.delete(rsvp)
+        ics.bump(user_id)
         db.session.commit()
         return jsonify(msg="RSVP eliminado"), 200
 
@@ -483,16 +688,23 @@ def create_app():
             return jsonify(error="No puedes comentar si no confirmaste asistencia."), 400
 
         try:
-            c = Comment(
-                user_id=user_id,
-                event_id=event_id,
-                rating=int(rating),
-                content=content
-            )
+            rating = int(rating)
         except (ValueError, TypeError):
             return jsonify(error="Rating debe ser un número entre 1 y 5."), 400
+        if not 1 <= rating <= 5:
+            return jsonify(error="Rating debe ser un número entre 1 y 5."), 400
 
+        c = Comment(
+            user_id=user_id,
+            event_id=event_id,
+            rating=rating,
+            content=content
+        )
         db.session.add(c)
+
+        # Histograma incremental: se suma 1 a la fila (evento, estrellas) en la misma transacción
+        increment_rating_count(event_id, rating)
+
         db.session.commit()
         return jsonify(msg="Comentario agregado"), 201
 
@@ -501,19 +713,78 @@ def create_app():
     @jwt_required()
     def list_comments(event_id):
         """
-        Lista todos los comentarios de un evento. (Se usan en detalle/pasados)
+        Lista los comentarios de un evento, del más reciente al más antiguo. (Se usan en detalle/pasados)
+        Paginación por cursor: ?limit=<n>&cursor=<valor de la cabecera X-Next-Cursor>.
         """
-        comments = Comment.query.filter_by(event_id=event_id).all()
-        return jsonify([
+        try:
+            limit = min(int(request.args.get('limit', PAGE_SIZE)), PAGE_SIZE_MAX)
+            cursor = request.args.get('cursor')
+            after = parse_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify(error="Parámetros de paginación inválidos."), 400
+        if limit < 1:
+            return jsonify(error="Parámetros de paginación inválidos."), 400
+
+        query = (
+            db.session.query(
+                Comment.id,
+                Comment.user_id,
+                User.username,
+                Comment.rating,
+                Comment.content,
+                Comment.created_at
+            )
+            .join(User, Comment.user_id == User.id)
+            .filter(Comment.event_id == event_id)
+        )
+        if after:
+            # Sin comparar tuplas: MySQL no convierte (a, b) < (x, y) en un rango del índice
+            query = query.filter(or_(
+                Comment.created_at < after[0],
+                and_(Comment.created_at == after[0], Comment.id < after[1])
+            ))
+
+        # Se pide una fila extra para saber si hay otra página
+        filas = query.order_by(Comment.created_at.desc(), Comment.id.desc()).limit(limit + 1).all()
+        pagina = filas[:limit]
+
+        resp = jsonify([
             {
                 "id":         c.id,
                 "user_id":    c.user_id,
-                "username":   c.user.username,
+                "username":   c.username,
                 "rating":     c.rating,
                 "content":    c.content,
                 "created_at": c.created_at.isoformat()
-            } for c in comments
-        ]), 200
+            } for c in pagina
+        ])
+        if len(filas) > limit:
+            ultimo = pagina[-1]
+            resp.headers['X-Next-Cursor'] = make_cursor(ultimo.created_at, ultimo.id)
+        return resp, 200
+
+
+    @app.route('/comments/<int:event_id>/summary', methods=['GET'])
+    @jwt_required()
+    def comments_summary(event_id):
+        """
+        Devuelve el histograma de calificaciones (1–5 estrellas) de un evento,
+        leído de la tabla event_rating_counts sin recorrer los comentarios.
+        """
+        filas = EventRatingCount.query.filter_by(event_id=event_id).all()
+
+        histograma = {str(estrellas): 0 for estrellas in range(1, 6)}
+        for fila in filas:
+            histograma[str(fila.rating)] = fila.count
+
+        total = sum(histograma.values())
+        suma  = sum(int(estrellas) * n for estrellas, n in histograma.items())
+        return jsonify({
+            "event_id":       event_id,
+            "total":          total,
+            "average_rating": round(suma / total, 2) if total else 0,
+            "histogram":      histograma
+        }), 200
         
         
     @app.route('/history', methods=['GET'])
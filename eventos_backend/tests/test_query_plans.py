@@ -0,0 +1,30 @@
+"""
+Control de planes de consulta: recorre todas las rutas sobre SQLite en memoria
+y falla si alguna consulta hace un recorrido completo de tabla.
+"""
+
+from app import query_plans
+from app.extensions import db
+from app.models import Event
+
+
+def test_replay_sin_recorridos_completos(app):
+    consultas, sin_escenario, errores = query_plans.replay(app)
+
+    assert consultas
+    assert [c["statement"] for c in consultas if c["full_scan"]] == []
+    assert sin_escenario == []
+    assert errores == []
+
+    # Las segundas páginas pasan los predicados de keyset por EXPLAIN
+    assert any("comments.created_at <" in c["statement"] for c in consultas)
+    assert any("events.event_date >" in c["statement"] and "rsvps" in c["statement"] for c in consultas)
+    # /stats usa SQL de MySQL y se omite en SQLite
+    assert all("GET /stats" not in c["routes"] for c in consultas)
+
+
+def test_replay_no_deja_datos(app):
+    query_plans.replay(app)
+
+    with app.app_context():
+        assert db.session.query(Event).count() == 0
@@ -97,10 +97,18 @@ export default function EventDetailScreen({ route, navigation }) {
     setLoadingComments(true);
     try {
       const token = await AsyncStorage.getItem("userToken");
-      const res = await client.get(`/comments/${event.id}`, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
-      setComments(res.data);
+      // El backend pagina por cursor: se siguen las páginas hasta que no haya X-Next-Cursor
+      let all = [];
+      let cursor = null;
+      do {
+        const res = await client.get(`/comments/${event.id}`, {
+          headers: { Authorization: `Bearer ${token}` },
+          params: cursor ? { cursor } : {},
+        });
+        all = all.concat(res.data);
+        cursor = res.headers["x-next-cursor"];
+      } while (cursor);
+      setComments(all);
     } catch (err) {
       console.log("Error loading comments:", err);
     } finally {